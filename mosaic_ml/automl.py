@@ -1,29 +1,32 @@
 # Mosaic library
-import json
 import logging
+import multiprocessing
 import os
+import shutil
 import sys
 import tempfile
-from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache, partial
 
 import numpy as np
-from networkx.readwrite import json_graph
-from networkx.readwrite.gpickle import write_gpickle
 # scipy
 from scipy.sparse import issparse
-# Metric
-from sklearn.metrics import (accuracy_score, balanced_accuracy_score,
-                             roc_auc_score)
 
-import pynisher
-import simplejson as json
-from mosaic.external.ConfigSpace import pcs_new as pcs
-from mosaic_ml.evaluator import (evaluate, evaluate_generate_metadata,
-                                 test_function)
-from mosaic_ml.metafeatures import get_dataset_metafeature_from_openml
-from mosaic_ml.model_config.encoding import OneHotEncoding
-from mosaic_ml.mosaic_wrapper.mosaic import SearchML
-from mosaic_ml.sklearn_env import SklearnEnv
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_PCS_SPARSE = os.path.join(_THIS_DIR, "model_config", "1_1.pcs")
+_PCS_DENSE = os.path.join(_THIS_DIR, "model_config", "1_0.pcs")
+
+
+@lru_cache(maxsize=4)
+def _load_config_space(path):
+    from mosaic.external.ConfigSpace import pcs_new as pcs
+    with open(path, "r") as f:
+        return pcs.read(f)
 
 
 class AutoML():
@@ -37,19 +40,29 @@ class AutoML():
                  exec_dir=None,
                  verbose=0,
                  ensemble_size=25,
+                 n_jobs=1,
+                 n_trees=1,
+                 parallel_strategy="tree",
+                 pipeline_cache_limit=1024,
                  ):
         self.time_budget = time_budget
         self.time_limit_for_evaluation = time_limit_for_evaluation
         self.memory_limit = memory_limit
+        self.pipeline_cache_limit = pipeline_cache_limit
         self.policy_arg = {"policy_name": "puct", "c": 1.3}
         self.searcher = None
         self.data_manager = data_manager
         self.seed = seed
         self.verbose = verbose
-        np.random.seed(seed)
         self.logger_automl = logging.getLogger('automl')
         self.ensemble_size = ensemble_size
         self.ensemble_dir = None
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.n_trees = n_trees
+        self.parallel_strategy = parallel_strategy
+        self.tree_results = []
+        self._worker_pool = None
+        self._shared_arrays = []
 
         # Create folder dir if exec_dir is None
         if exec_dir is None:
@@ -70,20 +83,26 @@ class AutoML():
             self.logger_automl.addHandler(handler)
 
         self.mosaic_dir = os.path.join(self.exec_dir, "mosaic")
+        from mosaic_ml.hashing import FastMemory
+        self._memory = FastMemory(location=os.path.join(self.exec_dir, "pipeline_cache"), verbose=0)
         self._set_scoring_func(scoring_func=scoring_func)
 
     def _set_scoring_func(self, scoring_func):
         if scoring_func == "balanced_accuracy":
+            from sklearn.metrics import balanced_accuracy_score
             self.scoring_func = balanced_accuracy_score
         elif scoring_func == "accuracy":
+            from sklearn.metrics import accuracy_score
             self.scoring_func = accuracy_score
         elif scoring_func == "roc_auc":
+            from sklearn.metrics import roc_auc_score
             self.scoring_func = roc_auc_score
         else:
             raise Exception("Score func {0} unknown".format(scoring_func))
 
     def adapt_search_space(self, X, y):
         import ConfigSpace.hyperparameters as CSH
+        from mosaic_ml.model_config.encoding import OneHotEncoding
         self.problem_dependant_parameter = ["preprocessor:feature_agglomeration:n_clusters",
                                             "preprocessor:kernel_pca:n_components",
                                             "preprocessor:kitchen_sinks:n_components",
@@ -91,19 +110,19 @@ class AutoML():
                                             # "preprocessor:fast_ica:n_components"
                                             ]
 
+        nb_normal = np.shape(X)[1]
         try:
-            enc = OneHotEncoding.OneHotEncoder()
-            nb_normal, nb_onehot_enc = np.shape(
-                X)[1], np.shape(enc.fit_transform(X))[1]
+            if issparse(X):
+                nb_onehot_enc = np.shape(OneHotEncoding.OneHotEncoder().fit_transform(X))[1]
+            else:
+                nb_onehot_enc = OneHotEncoding.count_active_features(X)
         except:
-            nb_normal, nb_onehot_enc = np.shape(X)[1], np.shape(X)[1]
+            nb_onehot_enc = nb_normal
 
         self.searcher.mcts.env.problem_dependant_param = self.problem_dependant_parameter
 
         try:
-            from sklearn.naive_bayes import MultinomialNB
-            MultinomialNB().fit(X, y)
-            is_positive = True
+            is_positive = self._is_non_negative(X)
         except:
             is_positive = False
 
@@ -113,6 +132,15 @@ class AutoML():
             "is_positive": is_positive
         }
 
+    def _is_non_negative(self, X, chunk_size=65536):
+        """Whether X only has non-negative values (NaN counts as negative).
+
+        Dense data is scanned by chunks of rows to stop at the first negative.
+        """
+        if issparse(X):
+            return X.nnz == 0 or bool(X.data.min() >= 0)
+        return all(np.all(X[i:i + chunk_size] >= 0) for i in range(0, len(X), chunk_size))
+
     def prepare_ensemble(self, X, y):
         from sklearn.model_selection import train_test_split
 
@@ -122,6 +150,7 @@ class AutoML():
         except Exception as e:
             raise (e)
 
+        # Same split as evaluate(seed=self.seed), y_valid must match its predictions
         _, _, y_train, y_test = train_test_split(
             X, y, test_size=0.329, random_state=self.seed)
         np.save(os.path.join(self.ensemble_dir, "y_valid.npy"), y_test)
@@ -130,15 +159,10 @@ class AutoML():
     def get_config_space(self, X):
         if issparse(X):
             self.logger_automl.info("Data is sparse")
-            return pcs.read(open(os.path.dirname(os.path4.abspath(__file__)) + "/model_config/1_1.pcs", "r"))
+            return _load_config_space(_PCS_SPARSE)
         else:
             self.logger_automl.info("Data is dense")
-            return pcs.read(open(os.path.dirname(os.path.abspath(__file__)) + "/model_config/1_0.pcs", "r"))
-
-    def fit(self, X, y, categorical_features=None, initial_configurations=[]):
-        return self.fit(X=X, y=y, X_test=None, y_test=None,
-                        categorical_features=categorical_features,
-                        initial_configurations=initial_configurations)
+            return _load_config_space(_PCS_DENSE)
 
     def fit(self, X, y,
             X_test = None,
@@ -147,67 +171,239 @@ class AutoML():
             initial_configurations = [],
             nb_simulation=np.inf,
             policy_arg={}):
-        X = np.array(X)
-        y = np.array(y)
+        from mosaic_ml.evaluator import evaluate, get_categorical_mask
+
+        if not issparse(X):
+            X = np.ascontiguousarray(X)
+        X_dtype = X.dtype
+        X = self._downcast_to_float32(X)
+        y = np.ascontiguousarray(y)
 
         self.logger_automl.info("-> X shape: {0}; y shape: {1}".format(str(X.shape), str(y.shape)))
         if X_test is not None:
-            X_test = np.array(X_test)
-            y_test = np.array(y_test)
+            if not issparse(X_test):
+                X_test = np.ascontiguousarray(X_test)
+            if X.dtype != X_dtype:
+                X_test = self._downcast_to_float32(X_test)
+            y_test = np.ascontiguousarray(y_test)
             self.logger_automl.info("-> X shape: {0}; y shape: {1}".format(str(X_test.shape), str(y_test.shape)))
 
+        categorical_mask = get_categorical_mask(categorical_features, X.shape[1])
         self.logger_automl.info("-> Categorical features: {0}".format(
-            str([i for i, x in enumerate(categorical_features) if x == "categorical"])))
-
-        config_space = self.get_config_space(X)
+            str(np.flatnonzero(categorical_mask).tolist())))
 
         if self.ensemble_size > 1:
             self.prepare_ensemble(X=X, y=y)
 
 
-        eval_func = partial(evaluate, X=X, y=y, score_func=self.scoring_func,
-                            categorical_features=categorical_features,
+        X_shared, y_shared = self._share_array(X, "X.npy"), self._share_array(y, "y.npy")
+        eval_func = partial(evaluate, X=X_shared, y=y_shared,
+                            score_func=self.scoring_func,
+                            categorical_features=categorical_mask,
                             seed=self.seed,
-                            test_data={"X_test": X_test, "y_test": y_test},
+                            test_data={"X_test": None if X_test is None else self._share_array(X_test, "X_test.npy"),
+                                       "y_test": y_test},
                             store_directory=self.ensemble_dir,
-                            ensemble_size=self.ensemble_size)
+                            ensemble_size=self.ensemble_size,
+                            memory=self._memory)
+
+        self.searcher = None
+        self.tree_results = []
+
+        # Root parallelization: independent trees with distinct seeds
+        tree_seeds = [int(s.generate_state(1)[0])
+                      for s in np.random.SeedSequence(self.seed).spawn(self.n_trees - 1)]
+        executor = None
+        futures = []
+        if len(tree_seeds) > 0:
+            executor = ProcessPoolExecutor(max_workers=len(tree_seeds))
+            for tree_seed in tree_seeds:
+                futures.append(executor.submit(self._fit_one_tree, X_shared, y_shared,
+                                               self._get_tree_eval_func(eval_func, tree_seed),
+                                               initial_configurations,
+                                               tree_seed,
+                                               "{0}_{1}".format(self.mosaic_dir, tree_seed)))
+
+        try:
+            best_config, best_score, _ = self._fit_one_tree(X, y, eval_func,
+                                                            initial_configurations,
+                                                            self.seed,
+                                                            self.mosaic_dir)
+
+            for future in as_completed(futures):
+                try:
+                    self.tree_results.append(future.result())
+                except Exception as e:
+                    self.logger_automl.error("Tree failed: {0}".format(e))
+        except BaseException:
+            # Do not wait for the time budget of the other trees
+            if executor is not None:
+                self._terminate_trees(executor, futures)
+            raise
+        finally:
+            # The other trees use the shared arrays until they end
+            if executor is not None:
+                executor.shutdown()
+            self._release_shared_arrays()
+
+        for config, score, _ in self.tree_results:
+            if score > best_score:
+                best_config, best_score = config, score
+
+        return best_config, best_score
+
+    def _terminate_trees(self, executor, futures):
+        """Cancel the trees not started yet and kill the running ones."""
+        for future in futures:
+            future.cancel()
+        # ProcessPoolExecutor cannot stop running tasks, its processes are killed
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+
+    def _downcast_to_float32(self, X):
+        """Cast float64 data to float32 once, if every finite value fits.
+
+        Evaluations then move half the memory and sklearn does not cast the
+        data again in each rollout.
+        """
+        data = X.data if issparse(X) else X
+        if data.dtype != np.float64:
+            return X
+
+        with np.errstate(invalid="ignore"):
+            if (np.abs(data) > np.finfo(np.float32).max).any():
+                return X
+
+        self.logger_automl.info("-> Cast data from float64 to float32")
+        return X.astype(np.float32)
+
+    def _share_array(self, X, name):
+        """Share X with the evaluation processes without pickling it.
+
+        X is copied once into shared memory, or saved to exec_dir when
+        multiprocessing.shared_memory is not available. evaluate() attaches
+        to it through load_array.
+        """
+        if issparse(X) or X.dtype.hasobject:
+            return X
+
+        if shared_memory is None:
+            path = os.path.join(self.exec_dir, name)
+            np.save(path, X)
+            return path
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, X.nbytes))
+        np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)[...] = X
+        self._shared_arrays.append(shm)
+        return (shm.name, X.shape, X.dtype.str)
+
+    def _release_shared_arrays(self):
+        from mosaic_ml.evaluator import release_array
+        for shm in self._shared_arrays:
+            release_array(shm.name)
+            shm.close()
+            shm.unlink()
+        self._shared_arrays = []
+
+    def __del__(self):
+        try:
+            self._release_shared_arrays()
+        except Exception:
+            pass
+
+    def _get_tree_eval_func(self, eval_func, seed):
+        """Store ensemble predictions of each tree in its own directory."""
+        if self.ensemble_dir is None:
+            return eval_func
+
+        tree_dir = os.path.join(self.ensemble_dir, "tree_{0}".format(seed))
+        os.mkdir(tree_dir)
+        for f in ["y_valid.npy", "y_test.npy"]:
+            shutil.copy(os.path.join(self.ensemble_dir, f), tree_dir)
+        return partial(eval_func, store_directory=tree_dir)
+
+    def _build_searcher(self, X, y, eval_func, seed, exec_dir):
+        from mosaic_ml.mosaic_wrapper.mosaic import SearchML
+        from mosaic_ml.sklearn_env import SklearnEnv
+
+        config_space = self.get_config_space(X)
 
         environment = SklearnEnv(eval_func=eval_func,
                                  config_space=config_space,
                                  mem_in_mb=self.memory_limit,
                                  cpu_time_in_s=self.time_limit_for_evaluation,
-                                 seed=self.seed)
+                                 seed=seed,
+                                 worker_pool=self._worker_pool,
+                                 eval_uses_history=self.ensemble_dir is not None,
+                                 cache_reducer=partial(self._memory.reduce_size_to,
+                                                       self.pipeline_cache_limit * 1024 * 1024))
 
         self.searcher = SearchML(environment=environment,
                                  time_budget=self.time_budget,
-                                 seed=self.seed,
+                                 seed=seed,
                                  policy_arg=self.policy_arg,
-                                 exec_dir=self.mosaic_dir,
-                                 verbose=self.verbose)
+                                 exec_dir=exec_dir,
+                                 verbose=self.verbose,
+                                 n_jobs=self.n_jobs,
+                                 parallel_strategy=self.parallel_strategy)
 
         self.adapt_search_space(X, y)
+        return self.searcher
 
-        try:
-            res = self.searcher.run(
-                nb_simulation=100000000000, initial_configurations=initial_configurations)
-        except Exception as e:
-            raise (e)
+    def _fit_one_tree(self, X, y, eval_func, initial_configurations, seed, exec_dir):
+        from mosaic_ml.evaluator import load_array
+        from mosaic_ml.worker_pool import EvaluationPool
 
-        return self.searcher.mcts.env.bestconfig["model"], self.searcher.mcts.env.bestconfig["validation_score"]
+        # Trees run in other processes get the shared arrays
+        X, y = load_array(X), load_array(y)
+        if "fork" in multiprocessing.get_all_start_methods():
+            self._worker_pool = EvaluationPool(eval_func, max(1, self.n_jobs),
+                                               initargs=(eval_func.keywords["X"], eval_func.keywords["y"]))
+        try:
+            searcher = self._build_searcher(X, y, eval_func, seed, exec_dir)
+            searcher.run(nb_simulation=100000000000, initial_configurations=initial_configurations)
+        finally:
+            if self._worker_pool is not None:
+                self._worker_pool.close()
+                self._worker_pool = None
+
+        env = searcher.mcts.env
+        # Run ids are only unique within a tree
+        for run in env.final_model:
+            run["tree"] = seed
+        return env.bestconfig["model"], env.bestconfig["validation_score"], env.final_model
+
+    def __getstate__(self):
+        # Trees run in other processes rebuild their own searcher
+        state = self.__dict__.copy()
+        state["searcher"] = None
+        state["_worker_pool"] = None
+        state["_shared_arrays"] = []
+        return state
 
     def get_run_history(self):
-        return self.searcher.get_history_run()
+        """Runs improving the best validation score, in chronological order.
+
+        With several trees, the improvements of all trees are merged on their
+        elapsed time, and a run is kept if it beats every earlier run.
+        """
+        history = self.searcher.get_history_run()
+        if len(self.tree_results) > 0:
+            runs = sorted(history + [run for _, _, runs in self.tree_results for run in runs],
+                          key=lambda run: run["elapsed_time"])
+            history = []
+            for run in runs:
+                if len(history) == 0 or run["validation_score"] > history[-1]["validation_score"]:
+                    history.append(run)
+        return history
 
     def get_test_performance(self, X, y, categorical_features, X_test=None, y_test=None):
-        test_func = pynisher.enforce_limits(mem_in_mb=self.memory_limit,
-                                            cpu_time_in_s=self.time_limit_for_evaluation * 3
-                                            )(test_function)
-        print("Get test performance ...")
-        return self.searcher.test_performance(X, y, X_test, y_test, test_func, categorical_features)
+        import pynisher
+        from mosaic_ml.evaluator import test_function
 
-    def get_test_performance(self, X, y, categorical_features, X_test=None, y_test=None):
         test_func = pynisher.enforce_limits(mem_in_mb=self.memory_limit,
                                             cpu_time_in_s=self.time_limit_for_evaluation * 3
-                                            )(test_function)
+                                            )(partial(test_function, random_state=self.seed))
         print("Get test performance ...")
-        return self.searcher.test_performance(X, y, X_test, y_test, test_func, categorical_features)
+        return self.searcher.test_performance(X, y, X_test, y_test, test_func, categorical_features,
+                                              runs=self.get_run_history())
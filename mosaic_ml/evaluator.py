@@ -85,12 +85,72 @@ def get_sample_weight(y):
     return sample_weights
 
 
-def config_to_pipeline(config, type_features, is_sparse, random_state):
+_loaded_arrays = {}
+# Attachments released while views of them were alive
+_kept_arrays = []
+
+
+def load_array(X):
+    """Attach to arrays shared by AutoML.fit, return anything else as is.
+
+    X is either a (name, shape, dtype) shared memory reference or the path of
+    a saved array. Arrays are kept per process, so persistent workers only
+    attach once.
+    """
+    import numpy as np
+    if isinstance(X, tuple):
+        if X[0] not in _loaded_arrays:
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(name=X[0])
+            _loaded_arrays[X[0]] = (shm, np.ndarray(X[1], dtype=X[2], buffer=shm.buf))
+        return _loaded_arrays[X[0]][1]
+    if isinstance(X, str):
+        import os
+        key = (X, os.stat(X).st_mtime_ns)
+        if key not in _loaded_arrays:
+            _loaded_arrays[key] = (None, np.load(X, mmap_mode="r"))
+        return _loaded_arrays[key][1]
+    return X
+
+
+def release_array(name):
+    """Forget an array attached by load_array and unmap it if it is unused.
+
+    Reading an unmapped array crashes the process, so an attachment still
+    referenced by a view stays mapped until the process exits.
+    """
+    import sys
+    shm, X = _loaded_arrays.pop(name, (None, None))
+    if shm is None:
+        return
+    # Views of X have X as base, unused X is only held here
+    in_use = sys.getrefcount(X) > 2
+    del X
+    if in_use:
+        _kept_arrays.append(shm)
+    else:
+        shm.close()
+
+
+def get_categorical_mask(type_features, n_features=None):
+    """Boolean mask of categorical features, from a mask or a list of feature types."""
+    import numpy as np
+    if type_features is None:
+        return np.zeros(n_features, dtype=bool)
+    type_features = np.asarray(type_features)
+    if type_features.dtype == bool:
+        return type_features
+    return type_features == "categorical"
+
+
+def config_to_pipeline(config, type_features, is_sparse, random_state, memory=None):
     from sklearn.pipeline import Pipeline
     from sklearn.compose import ColumnTransformer
+    import numpy as np
 
-    numerical_features = [i for i, x in enumerate(type_features) if x != "categorical"]
-    categorical_features = [i for i, x in enumerate(type_features) if x == "categorical"]
+    categorical_mask = get_categorical_mask(type_features)
+    numerical_features = np.flatnonzero(~categorical_mask)
+    categorical_features = np.flatnonzero(categorical_mask)
     # print("numerical_features", numerical_features)
     # print("categorical_features", categorical_features)
 
@@ -123,9 +183,16 @@ def config_to_pipeline(config, type_features, is_sparse, random_state):
 
     preprocessing_pipeline = ColumnTransformer(transformers=list_preprocessing, remainder = "drop")
 
-    pipeline_list = [
+    # Only the sklearn steps are cached: Pipeline clones the cached steps and
+    # the feature preprocessors do not implement get_params
+    data_preprocessing = Pipeline([
         evaluate_imputation(imputation_strategy),
         ("cleaning", preprocessing_pipeline),
+        ("output", "passthrough")
+    ], memory=memory)
+
+    pipeline_list = [
+        ("data_preprocessing", data_preprocessing),
         (name_pre, model_pre),
         (name_clf, model_clf)
     ]
@@ -135,7 +202,7 @@ def config_to_pipeline(config, type_features, is_sparse, random_state):
 
 
 def evaluate(config, runhistory, id_run, X=None, y=None, score_func=None, categorical_features=None,
-            seed=None, test_data = None, store_directory = None, ensemble_size=25):
+            seed=None, test_data = None, store_directory = None, ensemble_size=25, memory=None):
     try:
         from scipy.sparse import issparse
         import warnings
@@ -147,13 +214,14 @@ def evaluate(config, runhistory, id_run, X=None, y=None, score_func=None, catego
         import numpy as np
 
         start_time = time.time()
+        X, y = load_array(X), load_array(y)
 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
 
-            pipeline, balancing_strategy = config_to_pipeline(config, categorical_features, issparse(X), seed)
+            pipeline, balancing_strategy = config_to_pipeline(config, categorical_features, issparse(X), seed, memory)
 
-            name_clf = pipeline.steps[3][0]
+            name_clf = pipeline.steps[-1][0]
 
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.329, random_state = seed)
 
@@ -169,7 +237,7 @@ def evaluate(config, runhistory, id_run, X=None, y=None, score_func=None, catego
             info = {"validation_score": score}
 
             if test_data is not None:
-                pred_test = pipeline.predict(np.array(test_data["X_test"]))
+                pred_test = pipeline.predict(np.array(load_array(test_data["X_test"])))
                 info["test_score"] = score_func(test_data["y_test"], pred_test)
 
             if store_directory is not None:
@@ -180,7 +248,7 @@ def evaluate(config, runhistory, id_run, X=None, y=None, score_func=None, catego
                     run = info
                     run["id"] = id_run
                     run["elapsed_time"] = runhistory[-1]["elapsed_time"] + time.time() - start_time
-                    run["model"] = config.get_dictionary()
+                    run["model"] = dict(config)
 
                     ensemble_builder = Ensemble(runhistory + [run],
                             ensemble_size, 50, score_func, store_directory)
@@ -215,7 +283,7 @@ def evaluate_generate_metadata(config, bestconfig, id_run, X=None, y=None, score
             list_score_train = []
             list_score_test = []
 
-            name_clf = pipeline.steps[3][0]
+            name_clf = pipeline.steps[-1][0]
 
             #X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.329, random_state = seed)
 
@@ -249,7 +317,7 @@ def test_function(config, X_train, y_train, X_test, y_test, categorical_features
     with warnings.catch_warnings():
         pipeline, balancing_strategy = config_to_pipeline(config, categorical_features, issparse(X_train), random_state)
         fit_params = {}
-        name_clf = pipeline.steps[3][0]
+        name_clf = pipeline.steps[-1][0]
         if balancing_strategy and name_clf in ['adaboost', 'gradient_boosting', 'random_forest', 'extra_trees', 'sgd',
                                                'xgradient_boosting']:
             fit_params[name_clf + "__sample_weight"] = get_sample_weight(y_train)
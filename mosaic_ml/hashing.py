@@ -0,0 +1,69 @@
+"""joblib.Memory used as pipeline cache, with fast argument hashing."""
+import hashlib
+
+from joblib import Memory, hashing
+from joblib.func_inspect import filter_args
+from joblib.memory import MemorizedFunc
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+def _new_digest():
+    # 128 bits, joblib only manages cache entries named by 32 hex digits
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+class FastNumpyHasher(hashing.NumpyHasher):
+    """joblib hasher using xxh3 (or blake2b if xxhash is missing) instead of md5.
+
+    Cache keys only need to be collision free, not cryptographic, and hashing
+    the training data dominates each cache lookup for large arrays.
+    """
+
+    def __init__(self, coerce_mmap=False):
+        super().__init__(hash_name="md5", coerce_mmap=coerce_mmap)
+        self._hash = _new_digest()
+
+
+def fast_hash(obj, coerce_mmap=False):
+    return FastNumpyHasher(coerce_mmap=coerce_mmap).hash(obj)
+
+
+class FastMemorizedFunc(MemorizedFunc):
+    """MemorizedFunc keying its cache with fast_hash."""
+
+    def _get_argument_hash(self, *args, **kwargs):
+        return fast_hash(filter_args(self.func, self.ignore, args, kwargs),
+                         coerce_mmap=(self.mmap_mode is not None))
+
+    # Name of the method since joblib 1.3
+    _get_args_id = _get_argument_hash
+
+
+class FastMemory(Memory):
+    """joblib.Memory hashing the arguments with fast_hash.
+
+    Only the functions cached through this Memory use fast_hash, other joblib
+    caches of the process keep their md5 keys.
+    """
+
+    def cache(self, func=None, **kwargs):
+        memorized = super().cache(func, **kwargs)
+        if isinstance(memorized, MemorizedFunc):
+            memorized.__class__ = FastMemorizedFunc
+        return memorized
+
+    def reduce_size_to(self, bytes_limit):
+        """Remove the least recently used entries above bytes_limit."""
+        if self.store_backend is None:
+            return
+        if hasattr(self.store_backend, "enforce_store_limits"):
+            # joblib >= 1.3
+            self.store_backend.enforce_store_limits(bytes_limit)
+        else:
+            self.store_backend.reduce_store_size(bytes_limit)
@@ -70,7 +70,7 @@ def get_dataset_metafeature_from_openml(task_id):
     for f in list_metafeatures:
         try:
             val = dataset.qualities[f]
-            if not np.nan(val):
+            if not np.isnan(val):
                 features.append(val)
             else:
                 features.append(0)
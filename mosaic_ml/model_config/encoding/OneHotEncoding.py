@@ -356,3 +356,23 @@ class OneHotEncoder(BaseEstimator, TransformerMixin):
         """
         return _transform_selected(X, self._transform,
                                    self.categorical_features, copy=True)
+
+
+def count_active_features(X):
+    """Number of columns of ``OneHotEncoder().fit_transform(X)`` for dense X.
+
+    Counts the distinct encoded values of each feature with one column-wise
+    sort instead of building the one-hot matrix.
+    """
+    X = check_array(X, force_all_finite=False, copy=True)
+
+    # Same shift as in OneHotEncoder._fit_transform
+    X += 3
+    X[~np.isfinite(X)] = 2
+    X = X.astype(np.int32)
+
+    if X.min() < 0:
+        raise ValueError("X needs to contain only non-negative integers.")
+
+    X.sort(axis=0)
+    return X.shape[1] + np.count_nonzero(np.diff(X, axis=0))
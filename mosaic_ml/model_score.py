@@ -4,14 +4,16 @@ import pickle
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.exceptions import NotFittedError
+from sklearn.utils import check_random_state
 from sklearn.utils.validation import check_is_fitted
 
 
 class ScoreModel():
-    def __init__(self, nb_param, X=None, y=None, id_most_import_class = None, dataset_features = []):
-        self.model = RandomForestRegressor()
-        self.model_of_time = RandomForestRegressor()
-        self.model_general = RandomForestRegressor()
+    def __init__(self, nb_param, X=None, y=None, id_most_import_class = None, dataset_features = [], random_state = None):
+        self.rng = check_random_state(random_state)
+        self.model = RandomForestRegressor(random_state=self.rng)
+        self.model_of_time = RandomForestRegressor(random_state=self.rng)
+        self.model_general = RandomForestRegressor(random_state=self.rng)
         self.nb_param = nb_param
         self.id_most_import_class = id_most_import_class
         self.path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data_score.p")
@@ -135,9 +137,9 @@ class ScoreModel():
         if self.nb_added > 5:
             weights = [np.abs(self.model.feature_importances_[id - self.nb_param]) for id in ids]
             weights = weights / sum(weights)
-            return np.random.choice(list(range(len(ids))), p=weights)
+            return self.rng.choice(list(range(len(ids))), p=weights)
         else:
-            return np.random.randint(len(ids))
+            return self.rng.randint(len(ids))
 
     def _get_sample_weight(self):
         count_id = {}
@@ -160,7 +162,7 @@ class ScoreModel():
         if len(value) == 1:
             return value[0]
         elif(len(self.X) < 10):
-            return np.random.choice(value)
+            return self.rng.choice(value)
 
         #TODO: to optimize
         N = len(self.X)
@@ -195,6 +197,6 @@ class ScoreModel():
                     else:
                         list_value[i] = 0
             else:
-                return np.random.choice(value)
+                return self.rng.choice(value)
             id_max = np.argmax(list_value)
             return value[id_max]
@@ -4,8 +4,10 @@ import logging
 import os
 import gc
 import time
+import threading
 import numpy as np
-import json
+import orjson
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from mosaic.utils import Timeout
 from mosaic.mcts import MCTS
@@ -18,18 +20,85 @@ class MctsML(MCTS):
     def __init__(self, env,
                  time_budget=3600,
                  bandit_policy = None,
-                 exec_dir = ""):
+                 exec_dir = "",
+                 n_jobs = 1,
+                 virtual_loss = 1,
+                 parallel_strategy = "tree",
+                 root_override = None,
+                 nb_simulation_per_branch = 5):
         super().__init__(env=env, bandit_policy=bandit_policy, time_budget=time_budget, exec_dir=exec_dir, coef_progressive_widening=0.6)
 
+        # Tree parallelization
+        self.n_jobs = n_jobs
+        self.virtual_loss = virtual_loss
+        self._pending_virtual_loss = {}
+        self._stop_search = threading.Event()
+
+        # Branch parallelization
+        self.parallel_strategy = parallel_strategy
+        self.root_override = root_override
+        self.nb_simulation_per_branch = nb_simulation_per_branch
+        self.c_branch = (bandit_policy or {}).get("c", 1.3)
+        self.id_class = {}
+        self._local = threading.local()
+
     def MCT_SEARCH(self):
-        reward, config = super().MCT_SEARCH()
+        try:
+            reward, config = super().MCT_SEARCH()
+        finally:
+            self._release_virtual_loss()
 
         write_gpickle(self.tree, os.path.join(self.exec_dir, "tree.pkl"))
-        with open(os.path.join(self.exec_dir, "full_log.json"), 'w') as outfile:
-            json.dump(self.env.history_score, outfile)
+        with open(os.path.join(self.exec_dir, "full_log.json"), 'wb') as outfile:
+            outfile.write(orjson.dumps(self.env.history_score, option=orjson.OPT_SERIALIZE_NUMPY))
 
         return reward, config
 
+    def TREEPOLICY(self, *args, **kwargs):
+        if self.n_jobs == 1:
+            return super().TREEPOLICY(*args, **kwargs)
+
+        # Virtual visits of the simulations in progress are only on the tree
+        # during the selection, BACKUP always sees the real statistics
+        pending = list(self._pending_virtual_loss.items())
+        for node, count in pending:
+            self._add_virtual_loss(node, count * self.virtual_loss)
+        try:
+            front = super().TREEPOLICY(*args, **kwargs)
+        finally:
+            for node, count in pending:
+                self._add_virtual_loss(node, -count * self.virtual_loss)
+
+        self._pending_virtual_loss[front] = self._pending_virtual_loss.get(front, 0) + 1
+        self._local.front = front
+        return front
+
+    def _release_virtual_loss(self):
+        front = getattr(self._local, "front", None)
+        if front is not None:
+            self._local.front = None
+            self._pending_virtual_loss[front] -= 1
+            if self._pending_virtual_loss[front] == 0:
+                del self._pending_virtual_loss[front]
+
+    def BESTCHILD(self, node, *args, **kwargs):
+        root = getattr(self._local, "root", None) or self.root_override
+        if node == 0 and root in self.id_class:
+            return self.id_class[root]
+        return super().BESTCHILD(node, *args, **kwargs)
+
+    def _add_virtual_loss(self, node, loss):
+        """Add (or remove) pending visits on the path from node to the root.
+
+        Nodes currently being evaluated by a worker look more visited, so that
+        concurrent selections spread over different branches. Only the visit
+        count is changed, not the accumulated reward: with a node value of
+        reward / visits, a pending visit counts as a visit with a reward of 0,
+        the worst validation score. The exploration term drops as well.
+        """
+        for n in set([node] + list(self.tree.get_parents(node))):
+            self.tree.set_attribute(n, "visits", self.tree.get_attribute(n, "visits") + loss)
+
     def create_node_for_algorithm(self):
         id_class = {}
         for cl in ["random_forest", "gradient_boosting", "libsvm_svc", "extra_trees", "bernoulli_nb", "multinomial_nb", "decision_tree", "gaussian_nb", "sgd", "passive_aggressive", "xgradient_boosting", "adaboost", "lda", "liblinear_svc", "qda", "k_nearest_neighbors"]:
@@ -55,10 +124,14 @@ class MctsML(MCTS):
                     score_each_cl = self.env.run_main_configuration()
 
                 id_class = self.create_node_for_algorithm()
+                self.id_class = id_class
                 for cl, vals in score_each_cl.items():
                     if len(vals) > 0:
                         [self.BACKUP(id_class[cl], s) for s in vals]
 
+                if self.n_jobs > 1:
+                    return self._run_parallel(n)
+
                 for i in range(n):
                     if time.time() - self.env.start_time < self.time_budget:
                         res, config = self.MCT_SEARCH()
@@ -77,5 +150,108 @@ class MctsML(MCTS):
                 self.logger.info("Budget exhausted.")
                 return 0
 
+    def _run_parallel(self, n):
+        """Run simulations with n_jobs workers sharing the same tree.
+
+        Each worker holds the search lock while selecting and backing up; the
+        environment releases it while the pipeline is evaluated.
+        """
+        if self.parallel_strategy == "branch":
+            # One algorithm subtree per worker at a time
+            worker, args = self._branch_worker, (set(),)
+            n_workers = min(self.n_jobs, len(self.id_class))
+        else:
+            worker, args = self._parallel_worker, ()
+            n_workers = self.n_jobs
+        self.logger.info("Run {0} parallel search with {1} workers".format(self.parallel_strategy, n_workers))
+
+        simulations = iter(range(n))
+        self._stop_search.clear()
+        self.env.search_lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+        futures = []
+        try:
+            futures = [executor.submit(worker, simulations, *args) for _ in range(n_workers)]
+            wait(futures)
+            for f in futures:
+                f.result()
+        finally:
+            # Interrupted by the time budget: stop the evaluations in progress
+            # and wait for the workers, the caller then reads the tree alone
+            self._stop_search.set()
+            if not all(f.done() for f in futures):
+                self.env.cancel_evaluations()
+            executor.shutdown(wait=True)
+            self.env.search_lock = None
+        self.logger.info("Budget exhausted.")
+        return 0
+
+    def _parallel_worker(self, simulations):
+        try:
+            with self.env.search_lock:
+                while not self._stop_search.is_set() and next(simulations, None) is not None:
+                    if time.time() - self.env.start_time >= self.time_budget:
+                        break
+                    try:
+                        res, config = self.MCT_SEARCH()
+                    except Timeout.Timeout:
+                        break
+
+                    if res > self.bestscore:
+                        self.bestscore = res
+                        self.bestconfig = config
+        finally:
+            self._stop_search.set()
+
+    def _branch_worker(self, simulations, claimed):
+        """Search one unclaimed algorithm subtree at a time.
+
+        The root is already expanded with one child per algorithm. A worker
+        claims the best unclaimed child by UCT, runs nb_simulation_per_branch
+        simulations below it, then releases it and picks again. There are at
+        most as many workers as branches, so a branch is always free.
+        """
+        try:
+            with self.env.search_lock:
+                while not self._stop_search.is_set():
+                    branch = self._select_unclaimed_branch(claimed)
+                    claimed.add(branch)
+                    self._local.root = branch
+                    try:
+                        for _ in range(self.nb_simulation_per_branch):
+                            if next(simulations, None) is None or time.time() - self.env.start_time >= self.time_budget:
+                                self._stop_search.set()
+                                break
+                            res, config = self.MCT_SEARCH()
+
+                            if res > self.bestscore:
+                                self.bestscore = res
+                                self.bestconfig = config
+                    except Timeout.Timeout:
+                        break
+                    finally:
+                        claimed.discard(branch)
+                        self._local.root = None
+        finally:
+            self._stop_search.set()
+
+    def _select_unclaimed_branch(self, claimed):
+        scores = {}
+        for run in self.env.history_score:
+            scores.setdefault(run["model"].get("classifier:__choice__"), []).append(run["validation_score"])
+        nb_run = max(1, len(self.env.history_score))
+
+        best_branch, best_value = None, -np.inf
+        for cl in self.id_class:
+            if cl in claimed:
+                continue
+            if len(scores.get(cl, [])) == 0:
+                value = np.inf
+            else:
+                value = np.mean(scores[cl]) + self.c_branch * np.sqrt(np.log(nb_run) / len(scores[cl]))
+            if best_branch is None or value > best_value:
+                best_branch, best_value = cl, value
+        return best_branch
+
     def print_tree(self, images):
         self.tree.draw_tree(images)
@@ -12,7 +12,10 @@ class SearchML(Search):
                  seed=1,
                  policy_arg={},
                  exec_dir="",
-                 verbose=False):
+                 verbose=False,
+                 n_jobs=1,
+                 parallel_strategy="tree",
+                 root_override=None):
         """Initialization algorithm.
 
         :param environment: environment class extending AbstractEnvironment
@@ -20,6 +23,9 @@ class SearchML(Search):
         :param seed: random seed
         :param policy_arg: specific option for MCTS policy
         :param exec_dir: directory to store tmp files
+        :param n_jobs: number of parallel workers sharing the search tree
+        :param parallel_strategy: "tree" (virtual loss) or "branch" (one algorithm subtree per worker)
+        :param root_override: restrict the search to the subtree of this algorithm
         """
         super().__init__(environment=environment,
                             time_budget=time_budget,
@@ -32,7 +38,10 @@ class SearchML(Search):
         self.mcts = MctsML(env=environment,
                            time_budget=time_budget,
                            bandit_policy=policy_arg,
-                           exec_dir=exec_dir)
+                           exec_dir=exec_dir,
+                           n_jobs=n_jobs,
+                           parallel_strategy=parallel_strategy,
+                           root_override=root_override)
 
         # config logger for automl
         # self.logger_automl = logging.getLogger('automl')
@@ -40,9 +49,9 @@ class SearchML(Search):
     def get_history_run(self):
         return self.mcts.env.final_model
 
-    def test_performance(self, X_train, y_train, X_test, y_test, func_test, categorical_features):
+    def test_performance(self, X_train, y_train, X_test, y_test, func_test, categorical_features, runs=None):
         scores = []
-        for r in self.mcts.env.final_model:
+        for r in (self.mcts.env.final_model if runs is None else runs):
             time = r["running_time"]
             model = r["model"]
             try:
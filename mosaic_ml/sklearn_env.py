@@ -2,6 +2,7 @@
 
 import logging
 import time
+from functools import partial
 
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
@@ -26,10 +27,19 @@ class SklearnEnv(MosaicEnvironment):
                  mem_in_mb=3024,
                  cpu_time_in_s=300,
                  use_parameter_importance=True,
-                 seed = 1):
+                 seed = 1,
+                 worker_pool = None,
+                 cache_reducer = None,
+                 cache_reduce_every = 10,
+                 eval_uses_history = True):
         """Constructor."""
         super().__init__(seed)
         self.eval_func = eval_func
+        self.worker_pool = worker_pool
+        self.cache_reducer = cache_reducer
+        self.cache_reduce_every = cache_reduce_every
+        # Without it, eval_func gets an empty run history
+        self.eval_uses_history = eval_uses_history
         self.config_space = config_space
         self.mem_in_mb = mem_in_mb
         self.cpu_time_in_s = cpu_time_in_s
@@ -43,15 +53,16 @@ class SklearnEnv(MosaicEnvironment):
 
         # Constrained evaluation
         self.max_eval_time = cpu_time_in_s
+        self.rng = np.random.RandomState(seed)
         self.score_model = ScoreModel(len(self.config_space._hyperparameters),
-                                        id_most_import_class=[self.config_space.get_idx_by_hyperparameter_name(p) for p in ["data_preprocessing:categorical_transformer:categorical_encoding:__choice__", "classifier:__choice__"]])
+                                        id_most_import_class=[self.config_space.get_idx_by_hyperparameter_name(p) for p in ["data_preprocessing:categorical_transformer:categorical_encoding:__choice__", "classifier:__choice__"]],
+                                        random_state=self.rng)
         self.history_score = []
         self.logger = logging.getLogger('mcts')
         self.final_model = []
 
         # statistics
         self.sucess_run = 0
-        self.rng = np.random.RandomState(seed)
 
         self.id = 0
         self.main_hyperparameter = ["classifier:__choice__",
@@ -96,6 +107,10 @@ class SklearnEnv(MosaicEnvironment):
         self.problem_dependant_param = []
         self.problem_dependant_value = {}
 
+        # Lock shared by parallel search workers, released during evaluation
+        self.search_lock = None
+        self._cancelled = False
+
     def print_config(self):
         self.logger_automl.info("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
         self.logger_automl.info("Memory limit = {0} MB".format(self.mcts.env.mem_in_mb))
@@ -204,7 +219,7 @@ class SklearnEnv(MosaicEnvironment):
         #ei_values = np.array([mu_gener * beta + (1 - beta) * mu_local for mu_gener, mu_local in zip(mu, mu_loc)])
 
         id_max = (-ei_values).argsort()[:3]
-        return [configs[np.random.choice(id_max)] for _ in range(3)]
+        return [configs[self.rng.choice(id_max)] for _ in range(3)]
 
 
     def rollout_with_model_performance(self, history=[]):
@@ -298,7 +313,7 @@ class SklearnEnv(MosaicEnvironment):
                 # print("Parameter importance activated")
                 id_param = self.score_model.most_importance_parameter([self.config_space.get_idx_by_hyperparameter_name(p) for p in possible_params])
             else:
-                id_param = np.random.randint(0, len(possible_params))
+                id_param = self.rng.randint(0, len(possible_params))
             next_param = possible_params[id_param]
 
             next_param_cs = self.config_space._hyperparameters[next_param]
@@ -336,7 +351,7 @@ class SklearnEnv(MosaicEnvironment):
             except Exception as e:
                 # print("error in ei")
                 raise(e)
-                value_param = np.random.choice(value_to_choose)
+                value_param = self.rng.choice(value_to_choose)
 
             history.append((next_param, value_param))
         except Exception as e:
@@ -391,20 +406,32 @@ class SklearnEnv(MosaicEnvironment):
     def _evaluate(self, config, type="normal"):
         self.check_time()
         self.id += 1
+        id_run = self.id
         start_time = time.time()
         if type == "normal":
-            eval_func = pynisher.enforce_limits(mem_in_mb=self.mem_in_mb, cpu_time_in_s=self.cpu_time_in_s)(self.eval_func)
+            eval_func = self._limit_eval_func(mem_in_mb=self.mem_in_mb)
         elif type == "init":
-            eval_func = pynisher.enforce_limits(mem_in_mb=5000, cpu_time_in_s=self.cpu_time_in_s)(self.eval_func)
+            eval_func = self._limit_eval_func(mem_in_mb=5000)
         else:
             eval_func = self.eval_func
+        history_score = list(self.history_score) if self.eval_uses_history else []
+        if self.search_lock is not None:
+            self.search_lock.release()
         try:
-            res = eval_func(config, self.history_score, self.id)
-            self.sucess_run += 1
+            # A plain dict is sent, not the config with its whole config space
+            res = eval_func(config.get_dictionary(), history_score, id_run)
 
         except Timeout.Timeout as e:
             res = None
             raise(e)
+        finally:
+            if self.search_lock is not None:
+                self.search_lock.acquire()
+        if self._cancelled:
+            raise Timeout.Timeout("Search interrupted")
+        self.sucess_run += 1
+        if self.cache_reducer is not None and self.sucess_run % self.cache_reduce_every == 0:
+            self.cache_reducer()
 
         if res is None:
             res = {"validation_score": 0, "info": None}
@@ -421,10 +448,17 @@ class SklearnEnv(MosaicEnvironment):
         else:
             self.score_model.partial_fit(np.nan_to_num(config.get_array()), 0, 3000)
 
-        self.log_result(res, config)
+        self.log_result(res, config, id_run)
 
         return res["validation_score"]
 
+    def _limit_eval_func(self, mem_in_mb):
+        # The pool runs the eval_func it was created with
+        if self.worker_pool is not None and self.worker_pool.eval_func is self.eval_func:
+            return partial(self.worker_pool.evaluate,
+                           mem_in_mb=mem_in_mb, cpu_time_in_s=self.cpu_time_in_s)
+        return pynisher.enforce_limits(mem_in_mb=mem_in_mb, cpu_time_in_s=self.cpu_time_in_s)(self.eval_func)
+
     def run_default_configuration(self):
         # print("Run default configuration")
         try:
@@ -433,6 +467,15 @@ class SklearnEnv(MosaicEnvironment):
         except Exception as e:
             raise(e)
 
+    def cancel_evaluations(self):
+        """Stop the evaluations in progress, they raise Timeout when they return.
+
+        Evaluations run by pynisher are not stopped before their own limit.
+        """
+        self._cancelled = True
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+
     def check_time(self):
         if time.time() - self.start_time < 3600:
             return True
@@ -592,7 +635,7 @@ class SklearnEnv(MosaicEnvironment):
         if id in ids:
             self.score_model.dataset_features = ranks[ids.index(id)]
         else:
-            return list(np.random.choice(ids, 5))
+            return list(self.rng.choice(ids, 5))
 
         sim_for_data = X_sim[ids.index(id)]
 
@@ -646,9 +689,9 @@ class SklearnEnv(MosaicEnvironment):
                     pass
         return configs
 
-    def log_result(self, res, config):
+    def log_result(self, res, config, id_run=None):
         run = res
-        run["id"] = self.id
+        run["id"] = self.id if id_run is None else id_run
         run["elapsed_time"] = time.time() - self.start_time
         run["model"] = config.get_dictionary()
         for k, v in config.get_dictionary().items():
@@ -0,0 +1,136 @@
+"""Persistent pool of forked workers evaluating pipelines under resource limits."""
+
+import multiprocessing
+import queue
+import resource
+import signal
+import threading
+
+from mosaic_ml.evaluator import load_array
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("Evaluation time limit reached")
+
+
+def _worker_init(*arrays):
+    for X in arrays:
+        load_array(X)
+
+
+def _limited_evaluate(eval_func, args, mem_in_mb, cpu_time_in_s):
+    """Run eval_func(*args) with a memory and a time limit, None on failure."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = mem_in_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    signal.alarm(int(cpu_time_in_s))
+    try:
+        return eval_func(*args)
+    except Exception:
+        return None
+    finally:
+        signal.alarm(0)
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+        signal.signal(signal.SIGALRM, handler)
+
+
+def _worker_loop(conn, eval_func, arrays):
+    _worker_init(*arrays)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        conn.send(_limited_evaluate(eval_func, *task))
+
+
+class _Worker():
+    """One forked process, fed through a pipe by one caller at a time."""
+
+    def __init__(self, ctx, eval_func, initargs):
+        self.conn, child_conn = ctx.Pipe()
+        # Forked, eval_func and the data it holds are not pickled
+        self.process = ctx.Process(target=_worker_loop, args=(child_conn, eval_func, initargs), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.nb_tasks = 0
+
+    def terminate(self):
+        self.process.terminate()
+        self.process.join()
+
+
+class EvaluationPool():
+    """Replacement of pynisher.enforce_limits reusing forked workers.
+
+    Workers are forked once with eval_func and the data already mapped,
+    instead of one new process per evaluation, and each task only sends the
+    arguments of eval_func. Limits are set by the worker for each task. A
+    worker stuck past its time limit is replaced alone, and each worker is
+    replaced after maxtasksperchild tasks so that leaks do not pile up.
+    """
+
+    def __init__(self, eval_func, n_workers=1, initargs=(), maxtasksperchild=10):
+        self.eval_func = eval_func
+        self.n_workers = n_workers
+        self.initargs = initargs
+        self.maxtasksperchild = maxtasksperchild
+        self._ctx = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = set()
+        self._idle = queue.Queue()
+        for _ in range(n_workers):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self):
+        worker = _Worker(self._ctx, self.eval_func, self.initargs)
+        self._workers.add(worker)
+        return worker
+
+    def evaluate(self, *args, mem_in_mb=3024, cpu_time_in_s=300):
+        worker = self._idle.get()
+        if worker is None:
+            # Closed, wake up the next waiting caller
+            self._idle.put(None)
+            return None
+
+        healthy = False
+        try:
+            worker.nb_tasks += 1
+            worker.conn.send((args, mem_in_mb, cpu_time_in_s))
+            # Worker blocked in native code if SIGALRM could not stop it
+            if worker.conn.poll(cpu_time_in_s + 10):
+                res = worker.conn.recv()
+                healthy = True
+                return res
+            return None
+        except (EOFError, OSError):
+            # Worker killed (out of memory) or pool closed
+            return None
+        finally:
+            self._release(worker, healthy)
+
+    def _release(self, worker, healthy):
+        with self._lock:
+            if self._closed:
+                return
+            if not healthy or worker.nb_tasks >= self.maxtasksperchild:
+                self._workers.discard(worker)
+                worker.terminate()
+                worker = self._start_worker()
+            self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for worker in self._workers:
+                worker.terminate()
+            self._workers.clear()
+            self._idle.put(None)
@@ -0,0 +1,95 @@
+import ast
+import inspect
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from mosaic_ml.automl import AutoML
+
+
+def test_fit_signature():
+    params = list(inspect.signature(AutoML.fit).parameters)
+    assert params == ["self", "X", "y", "X_test", "y_test", "categorical_features",
+                      "initial_configurations", "nb_simulation", "policy_arg"]
+    assert AutoML.fit.__code__.co_argcount == len(params)
+
+
+def test_no_shadowed_method():
+    class_def = ast.parse(inspect.getsource(AutoML)).body[0]
+    names = [node.name for node in class_def.body if isinstance(node, ast.FunctionDef)]
+    assert len(names) == len(set(names))
+
+
+def test_run_history_merges_trees():
+    automl = AutoML(ensemble_size=0)
+    main_runs = [{"id": 1, "tree": 1, "elapsed_time": 1, "validation_score": 0.5},
+                 {"id": 2, "tree": 1, "elapsed_time": 5, "validation_score": 0.7}]
+    other_runs = [{"id": 1, "tree": 2, "elapsed_time": 2, "validation_score": 0.6},
+                  {"id": 2, "tree": 2, "elapsed_time": 4, "validation_score": 0.8}]
+    automl.searcher = SimpleNamespace(get_history_run=lambda: main_runs)
+    automl.tree_results = [(None, 0.8, other_runs)]
+
+    history = automl.get_run_history()
+    assert [(run["tree"], run["id"]) for run in history] == [(1, 1), (2, 1), (2, 2)]
+    assert history[-1]["validation_score"] == 0.8
+
+
+def test_downcast_to_float32():
+    automl = AutoML(ensemble_size=0)
+    X = np.array([[1.5, -2.0], [np.nan, 3.0]])
+    assert automl._downcast_to_float32(X).dtype == np.float32
+    assert automl._downcast_to_float32(csr_matrix(X)).dtype == np.float32
+
+    for X in [np.array([[1e300, 1.0]]), np.array([[np.inf, 1.0]]),
+              np.array([[1, "a"]], dtype=object), np.ones((2, 2), dtype=np.float32)]:
+        assert automl._downcast_to_float32(X) is X
+
+
+def test_is_non_negative():
+    automl = AutoML(ensemble_size=0)
+    X = np.abs(np.random.RandomState(0).randn(100, 3))
+    assert automl._is_non_negative(X)
+    assert automl._is_non_negative(csr_matrix(X))
+    assert automl._is_non_negative(csr_matrix((3, 3)))
+    assert automl._is_non_negative(X.astype(object))
+
+    X[99, 2] = -1
+    assert not automl._is_non_negative(X, chunk_size=10)
+    assert not automl._is_non_negative(csr_matrix(X))
+
+    X[99, 2] = np.nan
+    assert not automl._is_non_negative(X)
+    assert not automl._is_non_negative(csr_matrix(X))
+
+    with pytest.raises(TypeError):
+        automl._is_non_negative(np.array([[1, "a"]], dtype=object))
+
+
+def test_failed_tree_stops_other_trees(monkeypatch):
+    from multiprocessing import shared_memory
+
+    def _fit_one_tree(self, X, y, eval_func, initial_configurations, seed, exec_dir):
+        if seed == self.seed:
+            raise ValueError("main tree failed")
+        time.sleep(60)
+
+    # Trees are forked, they also run the patched method
+    monkeypatch.setattr(AutoML, "_fit_one_tree", _fit_one_tree)
+    automl = AutoML(ensemble_size=0, n_trees=3)
+    X, y = np.random.rand(20, 3), np.arange(20) % 2
+    shared = []
+    monkeypatch.setattr(automl, "_release_shared_arrays",
+                        lambda release=automl._release_shared_arrays: (
+                            shared.extend(shm.name for shm in automl._shared_arrays), release()))
+
+    start = time.time()
+    with pytest.raises(ValueError):
+        automl.fit(X, y)
+    assert time.time() - start < 30
+    assert len(shared) == 2
+    for name in shared:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
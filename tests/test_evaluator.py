@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from mosaic_ml import evaluator
+from mosaic_ml.automl import AutoML
+from mosaic_ml.evaluator import load_array, release_array
+from mosaic_ml.worker_pool import EvaluationPool
+
+
+def _sum(X):
+    return float(load_array(X).sum())
+
+
+def test_shared_array_round_trip():
+    automl = AutoML(ensemble_size=0)
+    X = np.arange(12.0).reshape(3, 4)
+    handle = automl._share_array(X, "X.npy")
+
+    loaded = load_array(handle)
+    np.testing.assert_array_equal(loaded, X)
+    assert load_array(handle) is loaded
+    del loaded
+
+    pool = EvaluationPool(_sum, 1, initargs=(handle,))
+    try:
+        assert pool.evaluate(handle) == X.sum()
+    finally:
+        pool.close()
+
+    nb_kept = len(evaluator._kept_arrays)
+    automl._release_shared_arrays()
+    assert handle[0] not in evaluator._loaded_arrays
+    assert len(evaluator._kept_arrays) == nb_kept
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle[0])
+
+
+def _read_view_after_release():
+    automl = AutoML(ensemble_size=0)
+    handle = automl._share_array(np.arange(12.0).reshape(3, 4), "X.npy")
+    view = load_array(handle)[1:]
+    automl._release_shared_arrays()
+    assert evaluator._kept_arrays[-1].name == handle[0]
+    assert view.sum() == 60
+
+
+def test_view_alive_after_release():
+    # Reading an unmapped view crashes the process, so run it in a child
+    process = multiprocessing.get_context("fork").Process(target=_read_view_after_release)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_saved_array_round_trip(tmpdir):
+    X = np.arange(6).reshape(2, 3)
+    path = os.path.join(str(tmpdir), "X.npy")
+    np.save(path, X)
+
+    loaded = load_array(path)
+    np.testing.assert_array_equal(loaded, X)
+    assert isinstance(loaded, np.memmap)
+    assert load_array(X) is X
+    release_array("unknown")
+
+
+def test_cached_pipeline_with_feature_preprocessor(tmpdir):
+    from sklearn.datasets import load_breast_cancer
+    from mosaic_ml.evaluator import config_to_pipeline
+    from mosaic_ml.hashing import FastMemory
+
+    X, y = load_breast_cancer(return_X_y=True)
+    config = {"balancing:strategy": "none",
+              "data_preprocessing:numerical_transformer:imputation:strategy": "mean",
+              "data_preprocessing:categorical_transformer:categorical_encoding:__choice__": "no_encoding",
+              "data_preprocessing:numerical_transformer:rescaling:__choice__": "standardize",
+              "classifier:__choice__": "gaussian_nb",
+              "feature_preprocessor:__choice__": "pca",
+              "feature_preprocessor:pca:keep_variance": 0.9,
+              "feature_preprocessor:pca:whiten": "False"}
+
+    pipeline, _ = config_to_pipeline(config, None, False, 1)
+    expected = pipeline.fit(X, y).predict(X)
+
+    memory = FastMemory(location=str(tmpdir), verbose=0)
+    for _ in range(2):
+        pipeline, _ = config_to_pipeline(config, None, False, 1, memory)
+        np.testing.assert_array_equal(pipeline.fit(X, y).predict(X), expected)
+    # Imputation and cleaning are both cached, once
+    outputs = [f for _, _, files in os.walk(str(tmpdir)) for f in files if f == "output.pkl"]
+    assert len(outputs) == 2
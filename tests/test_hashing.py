@@ -0,0 +1,45 @@
+import time
+
+import numpy as np
+from joblib import Memory, hashing
+
+from mosaic_ml.hashing import FastMemory, fast_hash
+
+
+def _double(X):
+    return X * 2
+
+
+def _args_hash(cached, X):
+    # Renamed _get_args_id in joblib 1.3
+    get_hash = getattr(cached, "_get_args_id", None) or cached._get_argument_hash
+    return get_hash(X)
+
+
+def test_fast_memory(tmpdir):
+    X = np.arange(10.0)
+    memory = FastMemory(location=str(tmpdir), verbose=0)
+    cached = memory.cache(_double)
+    np.testing.assert_array_equal(cached(X), X * 2)
+    assert _args_hash(cached, X) == fast_hash({"X": X})
+    assert cached.check_call_in_cache(X)
+
+
+def test_md5_left_to_other_caches(tmpdir):
+    FastMemory(location=str(tmpdir), verbose=0).cache(_double)
+    assert hashing.hash(1) == hashing.NumpyHasher(hash_name="md5").hash(1)
+    cached = Memory(location=str(tmpdir), verbose=0).cache(_double)
+    assert _args_hash(cached, np.arange(3.0)) == hashing.hash({"X": np.arange(3.0)})
+
+
+def test_reduce_size_to(tmpdir):
+    memory = FastMemory(location=str(tmpdir), verbose=0)
+    cached = memory.cache(_double)
+    for i in range(5):
+        cached(np.full(100000, i, dtype=float))
+        time.sleep(0.01)
+
+    # Outputs of 800kB, only the last one fits
+    memory.reduce_size_to(1024 * 1024)
+    assert not cached.check_call_in_cache(np.full(100000, 0, dtype=float))
+    assert cached.check_call_in_cache(np.full(100000, 4, dtype=float))
@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+from mosaic_ml import metafeatures
+
+
+def test_metafeatures_from_openml(monkeypatch):
+    qualities = {"NumberOfInstances": 150.0, "NumberOfClasses": 3.0, "ClassEntropy": float("nan")}
+    monkeypatch.setattr(metafeatures.openml.tasks, "get_task",
+                        lambda task_id: SimpleNamespace(dataset_id=task_id))
+    monkeypatch.setattr(metafeatures.openml.datasets, "get_dataset",
+                        lambda dataset_id: SimpleNamespace(qualities=qualities))
+
+    features = metafeatures.get_dataset_metafeature_from_openml(59)
+    assert len(features) == len(metafeatures.list_metafeatures)
+    assert features[metafeatures.list_metafeatures.index("NumberOfInstances")] == 150.0
+    # Missing and NaN qualities are 0
+    assert features[metafeatures.list_metafeatures.index("ClassEntropy")] == 0
+    assert features[metafeatures.list_metafeatures.index("MaxMutualInformation")] == 0
@@ -0,0 +1,20 @@
+import numpy as np
+
+from mosaic_ml.model_score import ScoreModel
+
+
+def _draws(random_state):
+    X = np.random.RandomState(0).rand(20, 4)
+    model = ScoreModel(4, X=list(X), y=list(X.sum(axis=1)), random_state=random_state)
+    parameters = [model.most_importance_parameter([4, 5, 6, 7]) for _ in range(10)]
+    model.nb_added = 10
+    parameters += [model.most_importance_parameter([4, 5, 6, 7]) for _ in range(10)]
+    return parameters, model.model.predict(X[:1])[0]
+
+
+def test_random_state():
+    np.random.seed(0)
+    global_state = np.random.get_state()[1].copy()
+
+    assert _draws(np.random.RandomState(1)) == _draws(np.random.RandomState(1))
+    np.testing.assert_array_equal(np.random.get_state()[1], global_state)
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from mosaic_ml.model_config.encoding import OneHotEncoding
+
+
+@pytest.mark.parametrize("X", [
+    np.random.RandomState(0).randint(0, 5, size=(50, 4)).astype(float),
+    np.array([[0.0, 1.5], [np.nan, 2.7], [np.nan, np.inf], [3.0, 1.2]]),
+    np.array([[1.0, 2.0, 3.0]]),
+    np.random.RandomState(1).rand(30, 3) * 10,
+])
+def test_count_active_features(X):
+    expected = OneHotEncoding.OneHotEncoder().fit_transform(X.copy()).shape[1]
+    assert OneHotEncoding.count_active_features(X) == expected
+
+
+def test_count_active_features_negative():
+    with pytest.raises(ValueError):
+        OneHotEncoding.count_active_features(np.array([[-5.0, 1.0]]))
@@ -0,0 +1,32 @@
+import pytest
+from sklearn.datasets import load_breast_cancer
+from sklearn.model_selection import train_test_split
+
+from mosaic_ml.automl import AutoML
+
+
+@pytest.mark.parametrize("parallel_strategy", ["tree", "branch"])
+def test_parallel_fit(parallel_strategy):
+    X, y = load_breast_cancer(return_X_y=True)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, random_state=1)
+
+    autoML = AutoML(time_budget=60,
+                    time_limit_for_evaluation=10,
+                    memory_limit=3024,
+                    seed=1,
+                    scoring_func="balanced_accuracy",
+                    ensemble_size=0,
+                    verbose=0,
+                    n_jobs=2,
+                    parallel_strategy=parallel_strategy
+                    )
+
+    best_config, best_score = autoML.fit(X_train, y_train, X_test, y_test)
+    assert best_config is not None
+    assert 0 < best_score <= 1
+
+    env = autoML.searcher.mcts.env
+    assert env.search_lock is None
+    ids = [run["id"] for run in env.history_score]
+    assert len(ids) == len(set(ids))
+    assert len(autoML.get_run_history()) > 0
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from mosaic_ml.worker_pool import EvaluationPool
+
+
+def _call(func, *args):
+    return func(*args)
+
+
+def _pid(*args):
+    return os.getpid()
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _stuck(seconds):
+    # Like native code, does not let SIGALRM interrupt it
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(seconds)
+    return seconds
+
+
+def test_evaluate():
+    pool = EvaluationPool(_call, 2)
+    try:
+        assert pool.evaluate(_sleep, 0) == 0
+    finally:
+        pool.close()
+
+
+def test_eval_func_not_pickled():
+    # Tasks only send the arguments, eval_func is inherited at fork
+    lock = threading.Lock()
+    pool = EvaluationPool(lambda x: (x, lock.locked()), 1)
+    try:
+        assert pool.evaluate(1) == (1, False)
+    finally:
+        pool.close()
+
+
+def test_timeout_returns_none():
+    pool = EvaluationPool(_call, 1)
+    try:
+        assert pool.evaluate(_sleep, 5, cpu_time_in_s=1) is None
+        assert pool.evaluate(_sleep, 0, cpu_time_in_s=1) == 0
+    finally:
+        pool.close()
+
+
+def test_stuck_worker_replaced_alone():
+    pool = EvaluationPool(_call, 2)
+    try:
+        result = {}
+        other = threading.Thread(target=lambda: result.setdefault("res", pool.evaluate(_sleep, 3)))
+        other.start()
+        time.sleep(0.5)
+        # Grace period of 10s after the time limit
+        assert pool.evaluate(_stuck, 30, cpu_time_in_s=1) is None
+        other.join()
+        assert result["res"] == 3
+    finally:
+        pool.close()
+
+
+def test_workers_recycled():
+    pool = EvaluationPool(_call, 1, maxtasksperchild=2)
+    try:
+        pids = [pool.evaluate(_pid) for _ in range(4)]
+        assert pids[0] == pids[1]
+        assert pids[1] != pids[2]
+        assert pids[2] == pids[3]
+    finally:
+        pool.close()
+
+
+def test_close_with_task_in_flight():
+    pool = EvaluationPool(_call, 1)
+    result = {}
+    waiting = threading.Thread(target=lambda: result.setdefault("res", pool.evaluate(_sleep, 30, cpu_time_in_s=60)))
+    waiting.start()
+    time.sleep(0.5)
+
+    start = time.time()
+    pool.close()
+    waiting.join(5)
+    assert not waiting.is_alive()
+    assert time.time() - start < 5
+    assert result["res"] is None
+    assert pool.evaluate(_sleep, 0) is None
+    assert len(multiprocessing.active_children()) == 0